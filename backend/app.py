@@ -1,237 +1,793 @@
 # app.py
 import os
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+import logging
+import re
+import time
+import datetime
+import uuid
+import hmac
+import random
+import typing
+import collections
+import asyncio
+from quart import Quart, request, jsonify
+from quart_cors import cors
 import google.generativeai as genai
-import json
-import requests # Still needed for Google Fact Check Tools API
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import caching
+import orjson
+import msgspec
+# pydantic (used by the SDK to build response_schema) rejects typing.TypedDict before Python 3.12
+from typing_extensions import TypedDict
+from quart.json.provider import DefaultJSONProvider
+import httpx # Async HTTP/2 client for Google Fact Check Tools API
+import llm_cache
+import semantic_cache
+import result_store
+from resilience import CallGuard, CircuitOpenError, is_transient_failure
+from json_extract import JsonObjectScanner
 
-# REMOVED: import asyncio
-# REMOVED: import nest_asyncio
-# REMOVED: nest_asyncio.apply()
+# Quart is the async drop-in for Flask: it runs on a real ASGI event loop
+# (hypercorn), so the Gemini and Fact Check calls can overlap instead of
+# each request blocking on them one after another.
+app = cors(Quart(__name__))
 
-app = Flask(__name__)
-CORS(app)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+# Process-local counters for tuning (retry rates etc.); logged, not exported
+metrics = collections.Counter()
+
+
+# --- orjson-backed JSON provider (used by jsonify and request.get_json) ---
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
 
 # --- API Keys Configuration ---
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 GOOGLE_FACT_CHECK_API_KEY = os.getenv('GOOGLE_FACT_CHECK_API_KEY', '')
+# Admin token for operational overrides (e.g. ?no_cache=1); unset disables them
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
 
 if not GEMINI_API_KEY:
-    print("WARNING: GEMINI_API_KEY environment variable not set. Please set it for production.")
+    logger.warning("GEMINI_API_KEY environment variable not set. Please set it for production.")
 if not GOOGLE_FACT_CHECK_API_KEY:
-    print("WARNING: GOOGLE_FACT_CHECK_API_KEY environment variable not set. Please set it for production.")
+    logger.warning("GOOGLE_FACT_CHECK_API_KEY environment variable not set. Please set it for production.")
 
 genai.configure(api_key=GEMINI_API_KEY)
 
-# --- Helper function to extract a claim using Gemini (NOW SYNCHRONOUS) ---
-def extract_claim_with_gemini(text):
+# --- Rate limits + circuit breakers for outbound calls (per worker) ---
+# Calls beyond the rate wait for a token; after CIRCUIT_FAIL_MAX consecutive failures
+# calls are skipped for CIRCUIT_RESET_TIMEOUT seconds and the "uncertain" fallback is used.
+CIRCUIT_FAIL_MAX = int(os.getenv('CIRCUIT_FAIL_MAX', '5'))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+
+# Only upstream trouble trips a breaker; a 4xx or a blocked prompt is about the request, not the service.
+def is_gemini_failure(exc):
+    return is_transient_failure(exc) or isinstance(
+        exc, (google_exceptions.ServerError, google_exceptions.TooManyRequests)
+    )
+
+def is_fact_check_failure(exc):
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return is_transient_failure(exc) or isinstance(exc, httpx.TransportError)
+
+gemini_guard = CallGuard(
+    "Gemini", max_rate=float(os.getenv('GEMINI_MAX_CALLS_PER_MINUTE', '60')),
+    fail_max=CIRCUIT_FAIL_MAX, reset_timeout=CIRCUIT_RESET_TIMEOUT, is_failure=is_gemini_failure,
+)
+fact_check_guard = CallGuard(
+    "Fact Check API", max_rate=float(os.getenv('FACT_CHECK_MAX_CALLS_PER_MINUTE', '60')),
+    fail_max=CIRCUIT_FAIL_MAX, reset_timeout=CIRCUIT_RESET_TIMEOUT, is_failure=is_fact_check_failure,
+)
+
+# --- Gemini model / prompt versions (part of every LLM cache key; bump on prompt changes) ---
+GEMINI_MODEL_NAME = "gemini-2.0-flash"
+ANALYSIS_PROMPT_VERSION = "v3"
+CLAIM_PROMPT_VERSION = "claim-v3"
+
+# --- Response schema for the analysis: Gemini is constrained to emit exactly this JSON,
+# and msgspec decodes + validates it against the same types in one pass ---
+class AiResultDetails(TypedDict):
+    sourceReliability: int
+    contentAnalysis: int
+    factChecking: int
+    linguisticAnalysis: int
+
+class AiResultOptional(TypedDict, total=False):
+    disclaimer: str
+
+class AiResult(AiResultOptional):
+    credibilityScore: int
+    classification: str
+    explanation: str
+    details: AiResultDetails
+
+AI_RESULT_DECODER = msgspec.json.Decoder(AiResult)
+
+# --- Fact Check API response: only the fields we read; everything else is skipped while decoding ---
+class FactCheckPublisher(msgspec.Struct):
+    name: str = "Unknown"
+
+class FactCheckReview(msgspec.Struct):
+    textualRating: typing.Optional[str] = None
+    url: typing.Optional[str] = None
+    publisher: FactCheckPublisher = msgspec.field(default_factory=FactCheckPublisher)
+
+class FactCheckClaim(msgspec.Struct):
+    claimReview: list[FactCheckReview] = []
+
+class FactCheckResponse(msgspec.Struct):
+    claims: list[FactCheckClaim] = []
+
+FACT_CHECK_DECODER = msgspec.json.Decoder(FactCheckResponse)
+
+ANALYSIS_GENERATION_CONFIG = genai.types.GenerationConfig(
+    response_mime_type="application/json",
+    response_schema=AiResult,
+)
+
+# --- Static prompt prefixes (sent once as system instructions; only the news content varies) ---
+ANALYSIS_SYSTEM_PROMPT = """
+You are an AI-powered fake news detection system. Analyze the following news content and, if provided, its source URL, for credibility.
+Focus on:
+- **Linguistic Analysis:** Tone (sensational, neutral, objective), use of emotionally charged language, grammar, spelling, stylistic inconsistencies.
+- **Claim Verifiability (internal):** Are claims presented as facts without evidence? Are sources cited (even if not externally verifiable by you)?
+- **Bias:** Is there a clear slant or agenda?
+- **Completeness:** Does the article present a balanced view or omit crucial context?
+- **Source Reliability (if URL provided):** Comment on the potential reliability suggested by the URL's domain structure (e.g., unusual TLDs, suspicious domain names).
+
+Provide a structured JSON response with the following fields. Ensure the JSON is valid and contains ONLY the JSON object, without any surrounding text or markdown formatting (e.g., no ```json or ```).
+{
+    "credibilityScore": [integer 0-100, where 0 is highly fake, 100 is highly credible],
+    "classification": ["real", "fake", "uncertain"],
+    "explanation": "A concise explanation of why this score and classification were given, highlighting key linguistic cues, biases, or lack of verifiable claims.",
+    "details": {
+        "sourceReliability": [integer 0-100],
+        "contentAnalysis": [integer 0-100],
+        "factChecking": [integer 0-100],
+        "linguisticAnalysis": [integer 0-100]
+    },
+    "disclaimer": "This analysis is based on the provided text and URL. For full fact-checking, independent verification from multiple trusted sources is recommended."
+}
+
+Your response MUST be a valid JSON object and nothing else.
+"""
+
+CLAIM_SYSTEM_PROMPT = """
+Extract the single most prominent factual claim from the following news content.
+Respond with ONLY the extracted claim text, nothing else. If no clear factual claim is present, respond with "No specific claim identified".
+"""
+
+# --- Gemini context caching for the static prompt prefixes ---
+# Explicit caches have a minimum token count, so prompt sizes are checked once per
+# worker and only prompts at or above it get a cache (and a refresh loop). Everything
+# else, or a prompt whose cache can't be created, is sent inline as a system
+# instruction, which still lets Gemini's implicit prefix caching apply. All of this
+# runs in a background task: serving never waits on Gemini being reachable.
+PROMPT_CACHE_MIN_TOKENS = int(os.getenv('PROMPT_CACHE_MIN_TOKENS', '4096'))
+PROMPT_CACHE_TTL_SECONDS = 3600
+PROMPT_CACHE_REFRESH_MARGIN_SECONDS = 300
+PROMPT_CACHE_CALL_TIMEOUT_SECONDS = 10
+
+# Models are built once (not per request) and reused; refresh_prompt_caches swaps
+# in a model bound to the cached prefix whenever a cache is (re)created.
+ANALYSIS_MODEL = genai.GenerativeModel(
+    GEMINI_MODEL_NAME,
+    system_instruction=ANALYSIS_SYSTEM_PROMPT,
+    generation_config=ANALYSIS_GENERATION_CONFIG,
+)
+CLAIM_MODEL = genai.GenerativeModel(GEMINI_MODEL_NAME, system_instruction=CLAIM_SYSTEM_PROMPT)
+INLINE_PROMPT_MODELS = {"analysis": ANALYSIS_MODEL, "claim": CLAIM_MODEL}
+PROMPT_GENERATION_CONFIGS = {"analysis": ANALYSIS_GENERATION_CONFIG, "claim": None}
+SYSTEM_PROMPTS = {
+    "analysis": (ANALYSIS_PROMPT_VERSION, ANALYSIS_SYSTEM_PROMPT),
+    "claim": (CLAIM_PROMPT_VERSION, CLAIM_SYSTEM_PROMPT),
+}
+
+prompt_caches = {}
+prompt_models = dict(INLINE_PROMPT_MODELS)
+prompt_cache_task = None
+
+async def find_cacheable_prompts():
+    """Names of the system prompts long enough for an explicit context cache."""
+    counter = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    names = []
+    for name, (version, system_prompt) in SYSTEM_PROMPTS.items():
+        try:
+            async with gemini_guard:
+                count = await asyncio.wait_for(counter.count_tokens_async(system_prompt), PROMPT_CACHE_CALL_TIMEOUT_SECONDS)
+            tokens = count.total_tokens
+        except Exception as e:
+            logger.warning("Could not count tokens for %s prompt, sending it inline: %s", name, e)
+            continue
+        if tokens >= PROMPT_CACHE_MIN_TOKENS:
+            names.append(name)
+        else:
+            logger.info("%s prompt is %d tokens (context cache minimum %d); sending it inline.", name, tokens, PROMPT_CACHE_MIN_TOKENS)
+    return names
+
+async def delete_prompt_cache(cache):
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        prompt = f"""
-        Extract the single most prominent factual claim from the following news content.
-        Respond with ONLY the extracted claim text, nothing else. If no clear factual claim is present, respond with "No specific claim identified".
+        await asyncio.to_thread(cache.delete)
+    except Exception as e:
+        # It expires on its own after PROMPT_CACHE_TTL_SECONDS anyway
+        logger.debug("Could not delete Gemini context cache %s: %s", cache.name, e)
+
+async def refresh_prompt_caches(names):
+    for name in names:
+        version, system_prompt = SYSTEM_PROMPTS[name]
+        previous = prompt_caches.get(name)
+        try:
+            prompt_caches[name] = await asyncio.wait_for(asyncio.to_thread(
+                caching.CachedContent.create,
+                model=f"models/{GEMINI_MODEL_NAME}",
+                display_name=f"fnd-{version}",
+                system_instruction=system_prompt,
+                ttl=datetime.timedelta(seconds=PROMPT_CACHE_TTL_SECONDS),
+            ), PROMPT_CACHE_CALL_TIMEOUT_SECONDS)
+            prompt_models[name] = genai.GenerativeModel.from_cached_content(
+                cached_content=prompt_caches[name],
+                generation_config=PROMPT_GENERATION_CONFIGS[name],
+            )
+            logger.debug("Gemini context cache ready for %s prompt: %s", name, prompt_caches[name].name)
+        except Exception as e:
+            prompt_caches.pop(name, None)
+            prompt_models[name] = INLINE_PROMPT_MODELS[name]
+            logger.warning("Gemini context cache unavailable for %s prompt, sending it inline: %s", name, e)
+        # The replaced cache is no longer referenced; don't keep paying storage for it until its TTL runs out
+        if previous is not None:
+            await delete_prompt_cache(previous)
+
+async def manage_prompt_caches():
+    names = await find_cacheable_prompts()
+    if not names:
+        return
+    while True:
+        await refresh_prompt_caches(names)
+        await asyncio.sleep(PROMPT_CACHE_TTL_SECONDS - PROMPT_CACHE_REFRESH_MARGIN_SECONDS)
+
+def prompt_model(name):
+    """Model bound to the cached prompt prefix if one exists, else to the inline system instruction."""
+    return prompt_models[name]
+
+# --- Prompt size limits (Gemini cost and time-to-first-token scale with input length) ---
+MAX_PROMPT_CHARS = 6000
+PROMPT_HEAD_CHARS = 4000
+PROMPT_TAIL_CHARS = 1500
+# The lede is where the headline claim usually lives
+MAX_CLAIM_PROMPT_CHARS = 800
+
+def trim_for_prompt(text):
+    """Keeps the head and tail of long articles, which carry most of the tone and sourcing cues."""
+    if len(text) <= MAX_PROMPT_CHARS:
+        return text
+    return text[:PROMPT_HEAD_CHARS] + "\n...[truncated]...\n" + text[-PROMPT_TAIL_CHARS:]
+
+# --- Cheap pre-checks: skip Gemini entirely for inputs that cannot yield a claim ---
+MIN_ANALYSIS_WORDS = 8
+URL_ONLY_RE = re.compile(r'^\s*(?:https?://|www\.)\S+\s*$', re.I)
+PLACEHOLDER_RE = re.compile(r'\blorem\s+ipsum\b', re.I)
+# A factual claim needs a predicate: an auxiliary/reporting verb or a past-tense form
+VERB_LIKE_RE = re.compile(
+    r"\b(?:is|are|was|were|be|been|being|am|has|have|had|do|does|did|will|would|shall|should|"
+    r"can|could|may|might|must|says?|said|claims?|claimed|reports?|reported|announced|"
+    r"shows?|showed|causes?|caused|\w{2,}ed)\b|\w+n't\b",
+    re.I,
+)
+
+def precheck_news_text(text):
+    """Returns a reason string if text is too trivial to analyze, else None."""
+    if URL_ONLY_RE.match(text):
+        return "the submission is only a URL; paste the article text instead."
+    if PLACEHOLDER_RE.search(text):
+        return "the submission looks like placeholder (lorem ipsum) text."
+    if len(text.split()) < MIN_ANALYSIS_WORDS:
+        return f"the submission has fewer than {MIN_ANALYSIS_WORDS} words."
+    return None
+
+def precheck_result(reason):
+    return {
+        "credibilityScore": 50, "classification": "uncertain",
+        "explanation": f"Not enough content to analyze: {reason}",
+        "details": {"sourceReliability": 50, "contentAnalysis": 50, "factChecking": 50, "linguisticAnalysis": 50},
+        "disclaimer": "No AI analysis was performed. For full fact-checking, independent verification from multiple trusted sources is recommended."
+    }
 
-        News Content: "{text}"
+# --- Helper function to extract a claim using Gemini (async, cached) ---
+async def extract_claim_with_gemini(text, use_cache=True):
+    if not VERB_LIKE_RE.search(text):
+        logger.debug("No verb-like token in text, skipping claim extraction.")
+        return None
+
+    cache_key = llm_cache.make_key(CLAIM_PROMPT_VERSION, GEMINI_MODEL_NAME, text)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            try:
+                claim = orjson.loads(cached)["claim"]
+                logger.debug("Claim served from cache: '%s'", claim)
+                return claim
+            except (orjson.JSONDecodeError, KeyError, TypeError):
+                logger.warning("Evicting malformed claim cache entry.")
+                llm_cache.delete(cache_key)
+
+    try:
+        model = prompt_model("claim")
+        prompt = f"""
+        News Content: "{text[:MAX_CLAIM_PROMPT_CHARS]}"
         """
-        # Using synchronous generate_content()
-        response = model.generate_content(prompt)
+        async with gemini_guard:
+            response = await model.generate_content_async(prompt)
         
         if response and response.candidates and len(response.candidates) > 0 and \
            response.candidates[0].content and response.candidates[0].content.parts and \
            len(response.candidates[0].content.parts) > 0:
             claim = response.candidates[0].content.parts[0].text.strip()
-            print(f"DEBUG: Claim extracted by Gemini (sync): '{claim}'")
-            return claim if claim != "No specific claim identified" else None
-        print(f"DEBUG: Gemini (sync) did not extract a specific claim from text: '{text}' - Response: {response.text}")
+            logger.debug("Claim extracted by Gemini: '%s'", claim)
+            claim = claim if claim != "No specific claim identified" else None
+            llm_cache.set(cache_key, orjson.dumps({"claim": claim}).decode())
+            return claim
+        logger.debug("Gemini did not extract a specific claim from text: '%s' - Response: %s", text, response)
+        return None
+    except CircuitOpenError as e:
+        logger.warning("Skipping claim extraction: %s", e)
         return None
     except Exception as e:
-        print(f"Error extracting claim with Gemini (sync): {e}")
+        logger.error("Error extracting claim with Gemini: %s", e)
         return None
 
-# --- Helper function to query Google Fact Check Tools API (synchronous, no change) ---
-def query_fact_check_api(claim):
+# --- Shared HTTP/2 client for the Fact Check API (one multiplexed keep-alive connection) ---
+FACT_CHECK_POOL_SIZE = 64
+FACT_CHECK_TIMEOUT = httpx.Timeout(5.0, connect=1.0)
+FACT_CHECK_MAX_RETRIES = 2
+FACT_CHECK_BACKOFF_FACTOR = 0.2
+FACT_CHECK_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+fact_check_client = None
+
+@app.before_serving
+async def create_http_client():
+    # One client per worker; with HTTP/2, concurrent fact-checks (e.g. a batch) share
+    # a single TCP+TLS connection as multiplexed streams instead of opening N.
+    global fact_check_client
+    fact_check_client = httpx.AsyncClient(
+        http2=True,
+        timeout=FACT_CHECK_TIMEOUT,
+        limits=httpx.Limits(max_connections=FACT_CHECK_POOL_SIZE),
+        # The key goes in a header, not the query string: httpx logs every request URL at INFO
+        headers={"X-Goog-Api-Key": GOOGLE_FACT_CHECK_API_KEY},
+    )
+
+@app.after_serving
+async def close_http_client():
+    if fact_check_client is not None:
+        await fact_check_client.aclose()
+
+@app.before_serving
+async def start_prompt_caches():
+    global prompt_cache_task
+    # Requests use the inline prompts until (and unless) a cache is ready
+    prompt_cache_task = asyncio.create_task(manage_prompt_caches())
+
+@app.after_serving
+async def stop_prompt_caches():
+    if prompt_cache_task is not None:
+        prompt_cache_task.cancel()
+
+async def get_with_retries(url, params):
+    """GET url and return the raw response body, retrying transient failures with exponential backoff."""
+    for attempt in range(FACT_CHECK_MAX_RETRIES + 1):
+        try:
+            response = await fact_check_client.get(url, params=params)
+            if response.status_code in FACT_CHECK_RETRY_STATUSES and attempt < FACT_CHECK_MAX_RETRIES:
+                logger.debug("Fact Check API returned %s, retrying (attempt %d).", response.status_code, attempt + 1)
+            else:
+                response.raise_for_status()
+                return response.content
+        except httpx.TransportError:
+            if attempt >= FACT_CHECK_MAX_RETRIES:
+                raise
+        await asyncio.sleep(FACT_CHECK_BACKOFF_FACTOR * (2 ** attempt))
+
+# --- Helper function to query Google Fact Check Tools API (async) ---
+async def query_fact_check_api(claim):
     if not GOOGLE_FACT_CHECK_API_KEY:
-        print("Google Fact Check API key not set. Skipping external fact check.")
+        logger.info("Google Fact Check API key not set. Skipping external fact check.")
         return None
 
     api_url = "https://factchecktools.googleapis.com/v1alpha1/claims:search"
     params = {
         "query": claim,
-        "key": GOOGLE_FACT_CHECK_API_KEY,
         "languageCode": "en"
     }
     
     try:
-        print(f"DEBUG: Querying Fact Check API with claim: '{claim}'")
-        response = requests.get(api_url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        print(f"DEBUG: Raw Fact Check API response: {json.dumps(data, indent=2)}")
-        
-        if data and 'claims' in data and len(data['claims']) > 0:
-            first_claim = data['claims'][0]
-            claim_review = first_claim.get('claimReview', [])
+        logger.debug("Querying Fact Check API with claim: '%s'", claim)
+        async with fact_check_guard:
+            body = await get_with_retries(api_url, params)
+        logger.debug("Raw Fact Check API response: %s", body)
+
+        data = FACT_CHECK_DECODER.decode(body)
+        if data.claims:
+            # A review without a rating has no verdict to report; use the first one that has one
+            claim_review = next((review for review in data.claims[0].claimReview if review.textualRating), None)
             if claim_review:
-                verdict = claim_review[0].get('textualRating')
-                url = claim_review[0].get('url')
-                publisher = claim_review[0].get('publisher', {}).get('name', 'Unknown')
-                print(f"DEBUG: Fact Check Result: Verdict='{verdict}', URL='{url}', Publisher='{publisher}'")
+                verdict = claim_review.textualRating
+                url = claim_review.url
+                publisher = claim_review.publisher.name
+                logger.debug("Fact Check Result: Verdict='%s', URL='%s', Publisher='%s'", verdict, url, publisher)
                 return {
                     "verdict": verdict,
                     "url": url,
                     "publisher": publisher
                 }
-        print("DEBUG: No relevant claims found by Fact Check API.")
+        logger.debug("No relevant claims found by Fact Check API.")
+        return None
+    except CircuitOpenError as e:
+        logger.warning("Skipping external fact check: %s", e)
+        return None
+    except httpx.HTTPError as e:
+        logger.error("Error querying Google Fact Check API: %s", e)
         return None
-    except requests.exceptions.RequestException as e:
-        print(f"Error querying Google Fact Check API: {e}")
+    except msgspec.DecodeError as e:
+        logger.error("Unexpected Fact Check API response structure: %s", e)
         return None
     except Exception as e:
-        print(f"Error processing Fact Check API response: {e}")
+        logger.error("Error processing Fact Check API response: %s", e)
         return None
 
+# --- Claim extraction chained into the external fact-check ---
+async def extract_and_fact_check(text, use_cache=True):
+    """Returns (extracted_claim, fact_check_data); the fact-check starts as soon as the claim is known."""
+    extracted_claim = await extract_claim_with_gemini(text, use_cache)
+    if not extracted_claim:
+        return None, None
+    return extracted_claim, await query_fact_check_api(extracted_claim)
 
-@app.route('/analyze-news', methods=['POST'])
-def analyze_news_endpoint(): # NOW SYNCHRONOUS (removed 'async')
-    data = request.json
-    news_text = data.get('content')
-    news_url = data.get('url')
 
-    if not news_text:
-        return jsonify({"error": "News content is required."}), 400
+def chunk_text(chunk):
+    # Streamed chunks without text parts (e.g. safety/finish metadata) raise on .text
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
 
-    ai_result = {}
-    fact_check_result = None
-    json_string = ""
+async def stream_json_object(model, contents):
+    """Streams a Gemini response, stopping as soon as the top-level JSON object closes.
 
-    try:
-        # Step 1: Perform linguistic analysis with Gemini (NOW SYNCHRONOUS CALL)
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        
-        gemini_analysis_prompt = f"""
-        You are an AI-powered fake news detection system. Analyze the following news content and, if provided, its source URL, for credibility.
-        Focus on:
-        - **Linguistic Analysis:** Tone (sensational, neutral, objective), use of emotionally charged language, grammar, spelling, stylistic inconsistencies.
-        - **Claim Verifiability (internal):** Are claims presented as facts without evidence? Are sources cited (even if not externally verifiable by you)?
-        - **Bias:** Is there a clear slant or agenda?
-        - **Completeness:** Does the article present a balanced view or omit crucial context?
-        - **Source Reliability (if URL provided):** Comment on the potential reliability suggested by the URL's domain structure (e.g., unusual TLDs, suspicious domain names).
-
-        Provide a structured JSON response with the following fields. Ensure the JSON is valid and contains ONLY the JSON object, without any surrounding text or markdown formatting (e.g., no ```json or ```).
-        {{
-            "credibilityScore": [integer 0-100, where 0 is highly fake, 100 is highly credible],
-            "classification": ["real", "fake", "uncertain"],
-            "explanation": "A concise explanation of why this score and classification were given, highlighting key linguistic cues, biases, or lack of verifiable claims.",
-            "details": {{
-                "sourceReliability": [integer 0-100],
-                "contentAnalysis": [integer 0-100],
-                "factChecking": [integer 0-100],
-                "linguisticAnalysis": [integer 0-100]
-            }},
-            "disclaimer": "This analysis is based on the provided text and URL. For full fact-checking, independent verification from multiple trusted sources is recommended."
-        }}
-
-        News Content:
-        "{news_text}"
-
-        News URL (Optional):
-        "{news_url if news_url else 'Not provided'}"
-
-        Your response MUST be a valid JSON object and nothing else.
-        """
+    Output is schema-constrained JSON, so this is one pass over the body; the scanner
+    also tolerates stray wrapping text if the SDK ever returns it.
+    Returns (response_text, json_string) with json_string "" if no complete object arrived.
+    """
+    scanner = JsonObjectScanner()
+    async with gemini_guard:
+        gemini_stream = await model.generate_content_async(contents, stream=True)
+        async for chunk in gemini_stream:
+            if scanner.feed(chunk_text(chunk)) is not None:
+                break
+    return scanner.text, scanner.result or ""
 
-        # Calling synchronous generate_content()
-        gemini_response = model.generate_content(gemini_analysis_prompt)
-        response_text = gemini_response.text if hasattr(gemini_response, 'text') else ""
-        print(f"DEBUG: Raw Gemini analysis response_text: {response_text[:500]}...")
+# --- Linguistic analysis with Gemini (async, streamed, cached) ---
+ANALYSIS_MAX_ATTEMPTS = 3
+ANALYSIS_RETRY_BACKOFF_SECONDS = 1.0
 
-        json_start = response_text.find('{')
-        json_end = response_text.rfind('}')
+async def analyze_content_with_gemini(news_text, news_url, use_cache=True):
+    cache_key = llm_cache.make_key(ANALYSIS_PROMPT_VERSION, GEMINI_MODEL_NAME, news_text, news_url)
+    if use_cache:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            try:
+                ai_result = AI_RESULT_DECODER.decode(cached)
+                logger.debug("Gemini analysis served from cache.")
+                return ai_result
+            except msgspec.DecodeError:
+                logger.warning("Evicting malformed Gemini analysis cache entry.")
+                llm_cache.delete(cache_key)
 
-        if json_start != -1 and json_end != -1 and json_end > json_start:
-            json_string = response_text[json_start : json_end + 1]
-        else:
-            print(f"WARNING: Gemini response did not contain a recognizable JSON object for content analysis. Raw response: {response_text}")
-            ai_result = {
-                "credibilityScore": 50,
-                "classification": "uncertain",
-                "explanation": "AI content analysis failed: Could not parse Gemini's response (not valid JSON or incomplete).",
-                "details": {
-                    "sourceReliability": 50, "contentAnalysis": 50, "factChecking": 50, "linguisticAnalysis": 50
-                },
-                "disclaimer": "AI content analysis failed. For full fact-checking, independent verification from multiple trusted sources is recommended."
-            }
-            
-        try:
-            if json_string:
-                ai_result = json.loads(json_string)
-                if not all(k in ai_result for k in ["credibilityScore", "classification", "explanation", "details"]):
-                    print(f"WARNING: AI result missing expected keys after parsing: {ai_result}")
-                    ai_result = {
-                        "credibilityScore": 50, "classification": "uncertain",
-                        "explanation": "AI content analysis returned an unexpected structure (missing keys).",
-                        "details": {"sourceReliability": 50, "contentAnalysis": 50, "factChecking": 50, "linguisticAnalysis": 50},
-                        "disclaimer": "AI content analysis returned an unexpected structure. For full fact-checking, independent verification from multiple trusted sources is recommended."
-                    }
-            elif not ai_result:
-                 ai_result = {
-                    "credibilityScore": 50, "classification": "uncertain",
-                    "explanation": "AI content analysis failed: No JSON string found in Gemini's response.",
-                    "details": {"sourceReliability": 50, "contentAnalysis": 50, "factChecking": 50, "linguisticAnalysis": 50},
-                    "disclaimer": "AI content analysis failed. For full fact-checking, independent verification from multiple trusted sources is recommended."
-                }
+    model = prompt_model("analysis")
+    gemini_analysis_prompt = f"""
+    News Content:
+    "{trim_for_prompt(news_text)}"
+
+    News URL (Optional):
+    "{news_url if news_url else 'Not provided'}"
+    """
 
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON from Gemini response: {e}. Raw JSON string: {json_string}")
-            ai_result = {
+    # Retry-with-feedback: on invalid output, show Gemini its previous answer and the
+    # error and ask again, rather than degrading straight to the "uncertain" default.
+    contents = [{"role": "user", "parts": [gemini_analysis_prompt]}]
+    for attempt in range(ANALYSIS_MAX_ATTEMPTS):
+        try:
+            response_text, json_string = await stream_json_object(model, contents)
+        except CircuitOpenError as e:
+            logger.warning("Skipping Gemini analysis: %s", e)
+            return {
                 "credibilityScore": 50, "classification": "uncertain",
-                "explanation": "AI content analysis returned malformed JSON.",
+                "explanation": "AI content analysis is temporarily unavailable (upstream service degraded). Please try again shortly.",
                 "details": {"sourceReliability": 50, "contentAnalysis": 50, "factChecking": 50, "linguisticAnalysis": 50},
-                "disclaimer": "AI content analysis returned malformed JSON. For full fact-checking, independent verification from multiple trusted sources is recommended."
+                "disclaimer": "AI content analysis was skipped. For full fact-checking, independent verification from multiple trusted sources is recommended."
             }
+        logger.debug("Raw Gemini analysis response_text: %.500s...", response_text)
+        try:
+            ai_result = AI_RESULT_DECODER.decode(json_string)
+            llm_cache.set(cache_key, json_string)
+            return ai_result
 
-        # Step 2: Extract a claim and perform external fact-check (NOW SYNCHRONOUS CALL)
-        extracted_claim = extract_claim_with_gemini(news_text) # Call the synchronous version
-        if extracted_claim:
-            fact_check_data = query_fact_check_api(extracted_claim)
-            if fact_check_data:
-                fact_check_result = {
-                    "factCheckVerdict": fact_check_data['verdict'],
-                    "factCheckUrl": fact_check_data['url'],
-                    "factCheckPublisher": fact_check_data['publisher']
-                }
-                verdict_lower = fact_check_data['verdict'].lower()
-                if "false" in verdict_lower or "debunked" in verdict_lower or "misinformation" in verdict_lower:
-                    ai_result['classification'] = 'fake'
-                    ai_result['credibilityScore'] = min(ai_result['credibilityScore'], 20)
-                    ai_result['explanation'] = f"External fact-check confirms this claim is {fact_check_data['verdict']}. " + ai_result['explanation']
-                    ai_result['classificationDisplay'] = f"FACT-CHECKED: {fact_check_data['verdict'].upper()}"
-                elif "true" in verdict_lower or "verified" in verdict_lower or "accurate" in verdict_lower:
-                    ai_result['classification'] = 'real'
-                    ai_result['credibilityScore'] = max(ai_result['credibilityScore'], 80)
-                    ai_result['explanation'] = f"External fact-check confirms this claim is {fact_check_data['verdict']}. " + ai_result['explanation']
-                    ai_result['classificationDisplay'] = f"FACT-CHECKED: {fact_check_data['verdict'].upper()}"
-                else:
-                    ai_result['classification'] = 'uncertain'
-                    ai_result['explanation'] = f"External fact-check verdict: {fact_check_data['verdict']}. " + ai_result['explanation']
-                    ai_result['classificationDisplay'] = f"FACT-CHECKED: {fact_check_data['verdict'].upper()}"
+        except msgspec.DecodeError as e: # malformed JSON or schema mismatch (msgspec.ValidationError)
+            # Schema-constrained output makes this rare (SDK/transport-level failures only)
+            logger.warning("Failed to parse JSON from Gemini response (attempt %d): %s. Raw response: %s", attempt + 1, e, response_text)
+            if not response_text.strip():
+                # No text at all (safety block, finish-reason-only stream): resending the same prompt won't change that
+                logger.warning("Gemini returned no text; not retrying.")
+                break
+            if attempt + 1 < ANALYSIS_MAX_ATTEMPTS:
+                metrics["analysis_json_retries"] += 1
+                logger.info("Retrying Gemini analysis with error feedback (total retries: %d)", metrics["analysis_json_retries"])
+                contents.append({"role": "model", "parts": [response_text]})
+                contents.append({"role": "user", "parts": [f"Your output had error: {e}. Return ONLY valid JSON per schema."]})
+                await asyncio.sleep(ANALYSIS_RETRY_BACKOFF_SECONDS * (attempt + 1) * random.uniform(0.5, 1.5))
+
+    metrics["analysis_json_failures"] += 1
+    ai_result = {
+        "credibilityScore": 50, "classification": "uncertain",
+        "explanation": "AI content analysis returned malformed JSON.",
+        "details": {"sourceReliability": 50, "contentAnalysis": 50, "factChecking": 50, "linguisticAnalysis": 50},
+        "disclaimer": "AI content analysis returned malformed JSON. For full fact-checking, independent verification from multiple trusted sources is recommended."
+    }
+    return ai_result
+
+
+# --- Fact-check verdict classification: one compiled scan instead of six substring tests ---
+VERDICT_RE = re.compile(r'false|debunked|misinformation|true|verified|accurate', re.I)
+VERDICT_MAP = {
+    "false": "fake", "debunked": "fake", "misinformation": "fake",
+    "true": "real", "verified": "real", "accurate": "real",
+}
+
+def classify_verdict(verdict):
+    """Maps a textual rating to 'fake', 'real' or 'uncertain'; any fake keyword wins over a real one."""
+    labels = {VERDICT_MAP[m.lower()] for m in VERDICT_RE.findall(verdict)}
+    if "fake" in labels:
+        return "fake"
+    if "real" in labels:
+        return "real"
+    return "uncertain"
+
+
+# --- Full pipeline for one article: semantic cache -> Gemini analysis + fact-check -> merge ---
+async def analyze_one(news_text, news_url, use_cache=True, on_analysis=None):
+    """Runs the full pipeline and returns the merged result.
+
+    If on_analysis is given it is called with a copy of the Gemini analysis as soon
+    as that is ready while a fact-check is still outstanding, so callers can answer
+    early and let the fact-check finish in the background.
+    """
+    fact_check_result = None
+
+    # Pre-check: trivially unanalyzable input gets a deterministic answer, no external calls
+    reason = precheck_news_text(news_text)
+    if reason:
+        logger.debug("Skipping analysis, %s", reason)
+        return precheck_result(reason)
+
+    # Step 0: Near-duplicate submissions reuse a stored analysis (semantic cache);
+    # only the fact-check is refreshed once it is older than FACT_CHECK_TTL_HOURS.
+    # Exact repeats are answered by llm_cache in Step 1, so they skip the embedding round trip.
+    analysis_key = llm_cache.make_key(ANALYSIS_PROMPT_VERSION, GEMINI_MODEL_NAME, news_text, news_url)
+    exact_hit = use_cache and llm_cache.get(analysis_key) is not None
+    # The embedding is a Gemini call too: same rate limit / breaker, and skipped outright while it's open
+    embed_needed = use_cache and not exact_hit and not gemini_guard.breaker.is_open
+    embedding = await semantic_cache.embed(news_text, gemini_guard) if embed_needed else None
+    semantic_version = f"{ANALYSIS_PROMPT_VERSION}|{CLAIM_PROMPT_VERSION}|{GEMINI_MODEL_NAME}"
+    # The semantic cache does blocking SQLite/memmap I/O; keep it off the event loop
+    hit = await asyncio.to_thread(semantic_cache.lookup, embedding, news_url, semantic_version) if embedding is not None else None
+    if hit:
+        entry_id, cached = hit
+        ai_result = cached['aiResult']
+        extracted_claim = cached['extractedClaim']
+        fact_check_data = cached['factCheckData']
+        if extracted_claim and not semantic_cache.fact_check_is_fresh(cached):
+            if on_analysis:
+                on_analysis(dict(ai_result))
+            fact_check_data = await query_fact_check_api(extracted_claim)
+            cached['factCheckData'] = fact_check_data
+            cached['factCheckedAt'] = time.time()
+            await asyncio.to_thread(semantic_cache.update, entry_id, cached)
+    else:
+        # Step 1: Linguistic analysis with Gemini, run concurrently with
+        # claim extraction + external fact-check (independent network waits)
+        claim_task = asyncio.ensure_future(extract_and_fact_check(news_text, use_cache))
+        try:
+            ai_result = await analyze_content_with_gemini(news_text, news_url, use_cache)
+        except BaseException:
+            claim_task.cancel()
+            raise
+        if on_analysis and not claim_task.done():
+            on_analysis(dict(ai_result))
+        extracted_claim, fact_check_data = await claim_task
+        # Only successful analyses reach the exact cache; mirror that for the semantic cache
+        if embedding is not None and llm_cache.get(analysis_key) is not None:
+            await asyncio.to_thread(semantic_cache.add, embedding, news_url, {
+                "aiResult": ai_result,
+                "extractedClaim": extracted_claim,
+                "factCheckData": fact_check_data,
+                "factCheckedAt": time.time(),
+            }, semantic_version)
+
+    # Step 2: Merge the external fact-check (already fetched above)
+    if extracted_claim:
+        if fact_check_data:
+            fact_check_result = {
+                "factCheckVerdict": fact_check_data['verdict'],
+                "factCheckUrl": fact_check_data['url'],
+                "factCheckPublisher": fact_check_data['publisher']
+            }
+            verdict_class = classify_verdict(fact_check_data['verdict'])
+            if verdict_class == 'fake':
+                ai_result['classification'] = 'fake'
+                ai_result['credibilityScore'] = min(ai_result['credibilityScore'], 20)
+                ai_result['explanation'] = f"External fact-check confirms this claim is {fact_check_data['verdict']}. " + ai_result['explanation']
+                ai_result['classificationDisplay'] = f"FACT-CHECKED: {fact_check_data['verdict'].upper()}"
+            elif verdict_class == 'real':
+                ai_result['classification'] = 'real'
+                ai_result['credibilityScore'] = max(ai_result['credibilityScore'], 80)
+                ai_result['explanation'] = f"External fact-check confirms this claim is {fact_check_data['verdict']}. " + ai_result['explanation']
+                ai_result['classificationDisplay'] = f"FACT-CHECKED: {fact_check_data['verdict'].upper()}"
             else:
-                print("DEBUG: Fact check data not found for extracted claim.")
+                ai_result['classification'] = 'uncertain'
+                ai_result['explanation'] = f"External fact-check verdict: {fact_check_data['verdict']}. " + ai_result['explanation']
+                ai_result['classificationDisplay'] = f"FACT-CHECKED: {fact_check_data['verdict'].upper()}"
         else:
-            print("DEBUG: No claim extracted, skipping external fact-check.")
+            logger.debug("Fact check data not found for extracted claim.")
+    else:
+        logger.debug("No claim extracted, skipping external fact-check.")
 
 
-        final_result = {**ai_result, **(fact_check_result if fact_check_result else {})}
-        print(f"DEBUG: Final result sent to frontend: {json.dumps(final_result, indent=2)}")
-        
-        return jsonify(final_result), 200
+    final_result = {**ai_result, **(fact_check_result if fact_check_result else {})}
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Final result: %s", orjson.dumps(final_result).decode())
+
+    return final_result
+
+
+def is_admin_request():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
 
+def use_cache_requested():
+    # Admin bypass: ?no_cache=1 forces fresh (paid) Gemini calls, so it needs the admin token
+    if request.args.get('no_cache', '0').lower() not in ('1', 'true', 'yes'):
+        return True
+    if not is_admin_request():
+        logger.warning("Ignoring no_cache=1 from %s: missing or invalid X-Admin-Token.", request.remote_addr)
+        return True
+    return False
+
+
+def sync_requested():
+    # Backwards compatible mode: ?sync=1 waits for the fact-check and returns the merged result
+    return request.args.get('sync', '0').lower() in ('1', 'true', 'yes')
+
+
+# --- Background work that outlives the request (fact-check leg, final logging) ---
+# Run via app.add_background_task: Quart awaits these on shutdown (up to
+# BACKGROUND_TASK_SHUTDOWN_TIMEOUT) before any after_serving hook closes the HTTP client.
+app.config["BACKGROUND_TASK_SHUTDOWN_TIMEOUT"] = 10
+
+async def analyze_and_store(request_id, news_text, news_url, use_cache, on_analysis, pipeline_done):
+    try:
+        final_result = await analyze_one(news_text, news_url, use_cache, on_analysis)
+        result_store.put(request_id, {"factCheckStatus": "done", "result": final_result})
     except Exception as e:
-        print(f"Error during AI analysis: {e}")
-        return jsonify({"error": f"An internal server error occurred during AI analysis: {str(e)}"}), 500
+        logger.error("Error during AI analysis: %s", e)
+        result_store.put(request_id, {
+            "factCheckStatus": "error",
+            "error": f"An internal server error occurred during AI analysis: {str(e)}",
+        })
+    finally:
+        if not pipeline_done.done():
+            pipeline_done.set_result(None)
+
+
+@app.route('/analyze-news', methods=['POST'])
+async def analyze_news_endpoint():
+    data = await request.get_json()
+    news_text = data.get('content')
+    news_url = data.get('url')
+    use_cache = use_cache_requested()
+
+    if not news_text:
+        return jsonify({"error": "News content is required."}), 400
+
+    if sync_requested():
+        try:
+            final_result = await analyze_one(news_text, news_url, use_cache)
+            return jsonify(final_result), 200
+
+        except Exception as e:
+            logger.error("Error during AI analysis: %s", e)
+            return jsonify({"error": f"An internal server error occurred during AI analysis: {str(e)}"}), 500
+
+    # Default: answer with the Gemini analysis as soon as it is ready (202) and let the
+    # fact-check finish in the background; poll GET /fact-check-result/<requestId>.
+    request_id = uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    analysis_ready = loop.create_future()
+    pipeline_done = loop.create_future()
+
+    def on_analysis(ai_result):
+        if not analysis_ready.done():
+            analysis_ready.set_result(ai_result)
+
+    result_store.put(request_id, {"factCheckStatus": "pending"})
+    app.add_background_task(analyze_and_store, request_id, news_text, news_url, use_cache, on_analysis, pipeline_done)
+    await asyncio.wait({analysis_ready, pipeline_done}, return_when=asyncio.FIRST_COMPLETED)
+
+    if analysis_ready.done():
+        return jsonify({
+            "requestId": request_id,
+            "analysis": analysis_ready.result(),
+            "factCheckStatus": "pending",
+        }), 202
+
+    # Nothing was left to wait for (pre-check, cache hit, no claim): return the final result directly
+    stored = result_store.get(request_id) or {}
+    if stored.get("factCheckStatus") == "done":
+        return jsonify(stored["result"]), 200
+    return jsonify({"error": stored.get("error", "An internal server error occurred during AI analysis.")}), 500
+
+
+@app.route('/fact-check-result/<request_id>', methods=['GET'])
+async def fact_check_result_endpoint(request_id):
+    stored = result_store.get(request_id)
+    if stored is None:
+        return jsonify({"error": "Unknown or expired request id."}), 404
+    return jsonify({"requestId": request_id, **stored}), 200
+
+
+# --- Batch analysis: items run concurrently, bounded to respect Gemini QPS ---
+MAX_BATCH_ITEMS = 50
+BATCH_CONCURRENCY = 16
+batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+async def analyze_batch_item(item, use_cache):
+    if not isinstance(item, dict) or not item.get('content'):
+        return {"error": "News content is required."}
+    async with batch_semaphore:
+        try:
+            return await analyze_one(item['content'], item.get('url'), use_cache)
+        except Exception as e:
+            logger.error("Error during AI analysis of batch item: %s", e)
+            return {"error": f"An internal server error occurred during AI analysis: {str(e)}"}
+
+
+@app.route('/analyze-news-batch', methods=['POST'])
+async def analyze_news_batch_endpoint():
+    data = await request.get_json()
+    items = data.get('items') if isinstance(data, dict) else None
+    use_cache = use_cache_requested()
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "A non-empty 'items' list is required."}), 400
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({"error": f"At most {MAX_BATCH_ITEMS} items are allowed per batch."}), 400
+
+    # gather preserves input order; per-item failures are reported in place
+    results = await asyncio.gather(*[analyze_batch_item(item, use_cache) for item in items])
+    return jsonify({"results": results}), 200
 
 if __name__ == '__main__':
-    # Use Flask's built-in run method. All Gemini calls are now synchronous.
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # Development server only (set DEBUG=1 for reload + debugger, LOG_LEVEL=DEBUG for verbose logs). In production run
+    #   cd backend && gunicorn app:app
+    # which picks up gunicorn.conf.py (uvicorn workers, one per CPU).
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('DEBUG', '0') == '1')
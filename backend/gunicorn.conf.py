@@ -0,0 +1,19 @@
+# gunicorn.conf.py
+# Production server config. Run from the backend directory:
+#   gunicorn app:app
+# Each worker is an ASGI (uvicorn) event loop, so one slow Gemini call never
+# blocks other clients; throughput scales with the worker count.
+import os
+import multiprocessing
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'uvicorn_worker.UvicornWorker'
+# Gemini analysis + fact-check can take several seconds; leave headroom.
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+# Import the app (Gemini client config, prompts) once in the master and fork it
+# into workers copy-on-write. Per-worker state (HTTP session, prompt caches,
+# SQLite handles) is created after the fork, at startup or on first use.
+preload_app = True
@@ -0,0 +1,58 @@
+# json_extract.py
+# One-pass extraction of the first complete top-level JSON object from model output
+# (which may be wrapped in markdown fences or followed by trailing text).
+import re
+
+# Only these characters can change the scanner state; everything between them is
+# skipped by the regex engine rather than walked in Python.
+_TOKEN_RE = re.compile(r'[{}"\\]')
+
+
+class JsonObjectScanner:
+    """Incrementally locates the first complete top-level {...} object in a stream of text.
+
+    Tracks brace depth while respecting string literals and escapes, so braces
+    inside JSON strings are ignored. Feed chunks as they arrive; feed() returns the
+    object text as soon as its closing brace is seen.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.result = None
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._skip_until = 0
+
+    def feed(self, chunk):
+        if self.result is not None:
+            return self.result
+        self.text += chunk
+        for match in _TOKEN_RE.finditer(self.text, self._pos):
+            i = match.start()
+            if i < self._skip_until:
+                continue
+            char = match.group()
+            if self._start == -1:
+                if char == '{':
+                    self._start = i
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if char == '\\':
+                    self._skip_until = i + 2
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    self.result = self.text[self._start : i + 1]
+                    return self.result
+        self._pos = len(self.text)
+        return None
+
@@ -0,0 +1,81 @@
+# llm_cache.py
+# Content-addressable cache for Gemini responses, backed by SQLite (WAL mode).
+# Prompts are deterministic functions of (prompt version, model, text, url),
+# so a repeat submission can be answered from disk instead of a new LLM call.
+import os
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'llm_cache.sqlite3'))
+LLM_CACHE_TTL_DAYS = float(os.getenv('LLM_CACHE_TTL_DAYS', '7'))
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_conn = None
+
+
+def _connection():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(LLM_CACHE_PATH), exist_ok=True)
+        _conn = sqlite3.connect(LLM_CACHE_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        _conn.commit()
+    return _conn
+
+
+def make_key(prompt_version, model, text, url=None):
+    """sha256(prompt_version | model | text | url) as a hex digest."""
+    raw = f"{prompt_version}|{model}|".encode() + text.encode() + b"|" + (url or "").encode()
+    return hashlib.sha256(raw).hexdigest()
+
+
+def get(key):
+    """Returns the cached value for key, or None on a miss or expired entry."""
+    try:
+        with _lock:
+            row = _connection().execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        if LLM_CACHE_TTL_DAYS > 0 and time.time() - created_at > LLM_CACHE_TTL_DAYS * 86400:
+            delete(key)
+            return None
+        return value
+    except sqlite3.Error as e:
+        logger.error("Error reading LLM cache: %s", e)
+        return None
+
+
+def set(key, value):
+    try:
+        with _lock:
+            conn = _connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error("Error writing LLM cache: %s", e)
+
+
+def delete(key):
+    try:
+        with _lock:
+            conn = _connection()
+            conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error("Error deleting LLM cache entry: %s", e)
@@ -0,0 +1,101 @@
+# resilience.py
+# Rate limiting + circuit breaking for outbound calls (Gemini, Fact Check API).
+# Under load spikes or upstream outages, unbounded calls and their retries amplify
+# the failure; a guard caps the call rate and, after a burst of failures, fails
+# fast for a cool-down period instead of calling out at all.
+import time
+import asyncio
+import logging
+from aiolimiter import AsyncLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a call while the circuit is open."""
+
+
+class CircuitBreaker:
+    """Opens after fail_max consecutive failures; after reset_timeout seconds a single
+    trial call is let through (half-open) and its outcome closes or re-opens the circuit."""
+
+    def __init__(self, name, fail_max=5, reset_timeout=30):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_call(self):
+        if self._opened_at is None:
+            return
+        if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+            raise CircuitOpenError(f"{self.name} circuit is open; skipping call")
+        self._trial_in_flight = True
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info("%s circuit closed after successful trial call", self.name)
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def release_trial(self):
+        """Frees the half-open trial slot when a call ends without saying anything about upstream health."""
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._trial_in_flight = False
+        if self._opened_at is not None or self._failures >= self.fail_max:
+            if self._opened_at is None:
+                logger.warning("%s circuit opened after %d consecutive failures", self.name, self._failures)
+            self._opened_at = time.monotonic()
+
+
+def is_transient_failure(exc):
+    """Default failure predicate: only timeouts and dropped connections count against the upstream."""
+    return isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError))
+
+
+class CallGuard:
+    """Async context manager combining a token-bucket rate limit with a circuit breaker.
+
+        async with guard:
+            await upstream_call()
+
+    is_failure(exc) decides whether an exception raised inside the block says the upstream
+    is unhealthy (timeouts, transport errors, 429/5xx) and should count towards opening the
+    circuit. Anything else (bad request, blocked prompt, ...) is the caller's problem and
+    leaves the breaker untouched.
+    """
+
+    def __init__(self, name, max_rate, time_period=60, fail_max=5, reset_timeout=30, is_failure=is_transient_failure):
+        self.limiter = AsyncLimiter(max_rate, time_period)
+        self.breaker = CircuitBreaker(name, fail_max=fail_max, reset_timeout=reset_timeout)
+        self.is_failure = is_failure
+
+    async def __aenter__(self):
+        self.breaker.before_call()
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            # Never reached the upstream; don't leave a half-open trial slot taken
+            self.breaker.release_trial()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.breaker.record_success()
+        elif isinstance(exc, Exception) and self.is_failure(exc):
+            self.breaker.record_failure()
+        else:
+            # Client-side errors, cancellation etc. say nothing about upstream health
+            self.breaker.release_trial()
+        return False
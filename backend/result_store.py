@@ -0,0 +1,62 @@
+# result_store.py
+# Short-lived store for results finished in the background (e.g. the fact-check leg
+# of /analyze-news), polled by clients via /fact-check-result/<request_id>.
+# Backed by SQLite (WAL mode) so every gunicorn worker sees the same entries.
+import os
+import time
+import orjson
+import sqlite3
+import logging
+import threading
+
+RESULT_STORE_PATH = os.getenv('RESULT_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'results.sqlite3'))
+RESULT_TTL_SECONDS = float(os.getenv('RESULT_TTL_SECONDS', '600'))
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_conn = None
+
+
+def _connection():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(RESULT_STORE_PATH), exist_ok=True)
+        _conn = sqlite3.connect(RESULT_STORE_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        _conn.commit()
+    return _conn
+
+
+def put(key, value):
+    """Stores a JSON-serializable value for RESULT_TTL_SECONDS; also purges expired entries."""
+    try:
+        now = time.time()
+        with _lock:
+            conn = _connection()
+            conn.execute("DELETE FROM results WHERE expires_at < ?", (now,))
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, orjson.dumps(value).decode(), now + RESULT_TTL_SECONDS),
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error("Error writing result store: %s", e)
+
+
+def get(key):
+    """Returns the stored value, or None if unknown or expired."""
+    try:
+        with _lock:
+            row = _connection().execute(
+                "SELECT value FROM results WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return orjson.loads(row[0]) if row else None
+    except (sqlite3.Error, orjson.JSONDecodeError) as e:
+        logger.error("Error reading result store: %s", e)
+        return None
@@ -0,0 +1,211 @@
+# semantic_cache.py
+# Embedding-similarity cache layered on top of llm_cache: paraphrased or lightly
+# edited versions of an already-analyzed story reuse the stored analysis when the
+# cosine similarity of their embeddings is >= SEMANTIC_CACHE_THRESHOLD.
+#
+# SQLite is the source of truth (slot allocation, payloads, the vector itself, LRU
+# bookkeeping) and is shared by every gunicorn worker. A fixed-capacity numpy memmap
+# mirrors the vectors (one slot per entry, normalized so a dot product is the cosine
+# similarity) and serves only as the search index: the brute-force inner product
+# picks a candidate slot, and the hit is confirmed against the vector stored in that
+# slot's row, so a slot being rewritten by another worker can't pair one article's
+# vector with another article's payload.
+#
+# Everything here is blocking (SQLite, memmap flush); callers on the event loop run
+# lookup/add/update via asyncio.to_thread, and _lock keeps those threads off the
+# shared connection at the same time.
+import os
+import time
+import uuid
+import asyncio
+import orjson
+import logging
+import sqlite3
+import threading
+import numpy as np
+import google.generativeai as genai
+from llm_cache import LLM_CACHE_TTL_DAYS
+
+SEMANTIC_CACHE_DIR = os.getenv('SEMANTIC_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'semantic_cache'))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.92'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '2000'))
+# Fact-check verdicts can change, so they go stale much sooner than the analysis.
+FACT_CHECK_TTL_HOURS = float(os.getenv('FACT_CHECK_TTL_HOURS', '24'))
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_DIM = 768
+# The embedding sits in front of every cache-miss analysis, so never let it hang
+EMBEDDING_TIMEOUT_SECONDS = float(os.getenv('EMBEDDING_TIMEOUT_SECONDS', '5'))
+
+# Short busy timeout: if another worker holds the write lock, a miss is cheaper than waiting
+SEMANTIC_CACHE_BUSY_TIMEOUT_SECONDS = 0.5
+
+_lock = threading.Lock()
+_vectors = None
+_conn = None
+
+
+def _load():
+    global _vectors, _conn
+    if _conn is not None:
+        return
+    os.makedirs(SEMANTIC_CACHE_DIR, exist_ok=True)
+    # isolation_level=None: transactions are explicit; BEGIN IMMEDIATE serializes writers across workers
+    conn = sqlite3.connect(
+        os.path.join(SEMANTIC_CACHE_DIR, 'entries.sqlite3'),
+        timeout=SEMANTIC_CACHE_BUSY_TIMEOUT_SECONDS, isolation_level=None, check_same_thread=False,
+    )
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS semantic_entries ("
+        "slot INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, url TEXT NOT NULL, "
+        "payload TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+    )
+
+    vectors_path = os.path.join(SEMANTIC_CACHE_DIR, 'vectors.f32')
+    shape = (SEMANTIC_CACHE_MAX_ENTRIES, EMBEDDING_DIM)
+    expected_size = shape[0] * shape[1] * 4
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if os.path.exists(vectors_path) and os.path.getsize(vectors_path) == expected_size:
+            vectors = np.memmap(vectors_path, dtype=np.float32, mode='r+', shape=shape)
+        else:
+            # Index file missing or sized for another capacity; stored rows no longer line up with it.
+            vectors = np.memmap(vectors_path, dtype=np.float32, mode='w+', shape=shape)
+            conn.execute("DELETE FROM semantic_entries")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    _vectors, _conn = vectors, conn
+
+
+async def embed(text, guard=None):
+    """Returns the normalized embedding of text, or None if embedding fails.
+
+    guard, if given, is an async context manager (rate limit + circuit breaker) the call runs under.
+    """
+    try:
+        call = asyncio.wait_for(
+            genai.embed_content_async(model=EMBEDDING_MODEL, content=text),
+            timeout=EMBEDDING_TIMEOUT_SECONDS,
+        )
+        if guard is not None:
+            async with guard:
+                result = await call
+        else:
+            result = await call
+        vec = np.asarray(result['embedding'], dtype=np.float32)
+        if vec.shape != (EMBEDDING_DIM,):
+            logger.warning("Unexpected embedding shape %s; semantic cache disabled for this request.", vec.shape)
+            return None
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else None
+    except Exception as e:
+        logger.error("Error embedding content for semantic cache: %s", e)
+        return None
+
+
+def lookup(vec, url=None, prompt_version=None):
+    """Returns (entry_id, payload) of the most similar cached entry for the same URL, or None.
+
+    Entries written under a different prompt version, or older than LLM_CACHE_TTL_DAYS,
+    are treated as misses and dropped so they can't shadow a fresh entry.
+    """
+    if vec is None:
+        return None
+    with _lock:
+        try:
+            _load()
+            slots = np.fromiter((row[0] for row in _conn.execute("SELECT slot FROM semantic_entries")), dtype=np.int64)
+            if not slots.size:
+                return None
+            scores = (_vectors @ vec)[slots]
+            best = int(np.argmax(scores))
+            if scores[best] < SEMANTIC_CACHE_THRESHOLD:
+                return None
+            slot = int(slots[best])
+            row = _conn.execute(
+                "SELECT id, url, payload, vector FROM semantic_entries WHERE slot = ?", (slot,)
+            ).fetchone()
+            if row is None:
+                return None
+            entry_id, entry_url, payload, stored_vec = row
+            # The row's own vector is authoritative; the memmap slot may be mid-rewrite by another worker.
+            similarity = float(np.frombuffer(stored_vec, dtype=np.float32) @ vec)
+            if similarity < SEMANTIC_CACHE_THRESHOLD or entry_url != (url or ""):
+                return None
+            payload = orjson.loads(payload)
+            if is_stale(payload, prompt_version):
+                logger.debug("Dropping stale semantic cache entry (slot=%d).", slot)
+                delete(entry_id)
+                return None
+            touch(entry_id)
+            logger.debug("Semantic cache hit (similarity=%.3f, slot=%d).", similarity, slot)
+            return entry_id, payload
+        except (sqlite3.Error, orjson.JSONDecodeError) as e:
+            logger.error("Error reading semantic cache: %s", e)
+            return None
+
+
+def add(vec, url, payload, prompt_version=None):
+    """Stores payload under vec, evicting the least recently used entry when full. Returns the entry id."""
+    if vec is None:
+        return None
+    payload = {**payload, "promptVersion": prompt_version, "createdAt": time.time()}
+    entry_id = uuid.uuid4().hex
+    with _lock:
+        try:
+            _load()
+            vec = np.asarray(vec, dtype=np.float32)
+            # Slot choice, vector write and row write happen under one write transaction,
+            # so two workers can never pick the same slot.
+            _conn.execute("BEGIN IMMEDIATE")
+            try:
+                used = {row[0] for row in _conn.execute("SELECT slot FROM semantic_entries")}
+                slot = next((i for i in range(SEMANTIC_CACHE_MAX_ENTRIES) if i not in used), None)
+                if slot is None:
+                    slot = _conn.execute("SELECT slot FROM semantic_entries ORDER BY last_used LIMIT 1").fetchone()[0]
+                _vectors[slot] = vec
+                _vectors.flush()
+                _conn.execute(
+                    "INSERT OR REPLACE INTO semantic_entries (slot, id, url, payload, vector, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                    (slot, entry_id, url or "", orjson.dumps(payload).decode(), vec.tobytes(), time.time()),
+                )
+                _conn.execute("COMMIT")
+            except BaseException:
+                _conn.execute("ROLLBACK")
+                raise
+            return entry_id
+        except sqlite3.Error as e:
+            logger.error("Error writing semantic cache: %s", e)
+            return None
+
+
+def update(entry_id, payload):
+    with _lock:
+        try:
+            _load()
+            _conn.execute("UPDATE semantic_entries SET payload = ? WHERE id = ?", (orjson.dumps(payload).decode(), entry_id))
+        except sqlite3.Error as e:
+            logger.error("Error updating semantic cache entry: %s", e)
+
+
+def delete(entry_id):
+    _conn.execute("DELETE FROM semantic_entries WHERE id = ?", (entry_id,))
+
+
+def touch(entry_id):
+    _conn.execute("UPDATE semantic_entries SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+
+
+def is_stale(payload, prompt_version):
+    if payload.get('promptVersion') != prompt_version:
+        return True
+    return LLM_CACHE_TTL_DAYS > 0 and time.time() - payload.get('createdAt', 0) > LLM_CACHE_TTL_DAYS * 86400
+
+
+def fact_check_is_fresh(payload):
+    return time.time() - payload.get('factCheckedAt', 0) <= FACT_CHECK_TTL_HOURS * 3600